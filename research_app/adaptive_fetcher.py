@@ -0,0 +1,152 @@
+# Adaptive Fetcher
+# Fetches search results in order of relevance and stops once new sources
+# stop improving the set of chunks most relevant to the query.
+
+import os
+import time
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import metrics
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveFetcher:
+    def __init__(self, content_processor, txtai_manager, max_workers=None, time_budget=None,
+                 patience=None, min_gain=None):
+        """
+        Args:
+            content_processor: ContentProcessor used to fetch and chunk pages
+            txtai_manager: TxtaiManager whose embedding model scores chunks
+            max_workers: Number of pages fetched concurrently
+            time_budget: Seconds after which no new fetches are started
+            patience: Consecutive low-gain sources tolerated before stopping
+            min_gain: Chunks a source must add to the top-k to count as useful
+        """
+        self.content_processor = content_processor
+        self.txtai_manager = txtai_manager
+        self.max_workers = max_workers or int(os.environ.get("ADAPTIVE_FETCH_WORKERS", 4))
+        self.time_budget = time_budget or float(os.environ.get("ADAPTIVE_TIME_BUDGET", 60))
+        self.patience = patience or int(os.environ.get("ADAPTIVE_PATIENCE", 2))
+        self.min_gain = min_gain or int(os.environ.get("ADAPTIVE_MIN_GAIN", 1))
+
+    def fetch(self, query, results, top_k=15, time_budget=None, max_workers=None):
+        """
+        Fetch and chunk search results until they stop adding relevant content
+
+        Results are fetched in order of SearXNG score with bounded concurrency.
+        Each completed page is chunked and its chunks are scored against the
+        query. A source is useful when at least min_gain of its chunks enter
+        the current top-k. Fetching stops after patience consecutive sources
+        that are not useful (once top_k chunks have been seen), or when the
+        time budget runs out.
+
+        Args:
+            query: Research query
+            results: SearXNG results with url and score
+            top_k: Size of the retrieval set being tracked
+            time_budget: Seconds allowed for fetching, overrides the default
+            max_workers: Concurrent fetches, overrides the default
+
+        Returns:
+            Tuple of processed documents and statistics about the run
+        """
+        time_budget = time_budget or self.time_budget
+        max_workers = max_workers or self.max_workers
+        candidates = [r['url'] for r in sorted(results, key=lambda r: r.get('score', 0) or 0, reverse=True)]
+
+        documents = []
+        top = []  # Min-heap of (score, sequence) for the best top_k chunks
+        sequence = 0
+        low_gain_streak = 0
+        fetched = 0
+        fetch_seconds = []
+        scoring_seconds = 0.0
+        stop_reason = "exhausted"
+
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = {}
+        next_index = 0
+
+        def submit_next():
+            nonlocal next_index
+            url = candidates[next_index]
+            next_index += 1
+            pending[metrics.submit(executor, self._process, url, query)] = url
+
+        try:
+            while next_index < len(candidates) and len(pending) < max_workers:
+                submit_next()
+
+            while pending:
+                remaining = time_budget - (time.perf_counter() - start)
+                if remaining <= 0:
+                    stop_reason = "time_budget"
+                    break
+
+                done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    docs, seconds = future.result()
+                    fetched += 1
+                    fetch_seconds.append(seconds)
+                    documents.extend(docs)
+
+                    # Count how many of this source's chunks make it into the top-k
+                    gain = 0
+                    scoring_start = time.perf_counter()
+                    scores = self.txtai_manager.score(query, [d["text"] for d in docs]) if docs else []
+                    scoring_seconds += time.perf_counter() - scoring_start
+                    for score in scores:
+                        sequence += 1
+                        if len(top) < top_k:
+                            heapq.heappush(top, (score, sequence))
+                            gain += 1
+                        elif score > top[0][0]:
+                            heapq.heapreplace(top, (score, sequence))
+                            gain += 1
+
+                    if gain < self.min_gain and len(top) >= top_k:
+                        low_gain_streak += 1
+                    else:
+                        low_gain_streak = 0
+                    logger.info(f"Adaptive fetch: {url} added {gain} of {len(docs)} chunks to the top {top_k}")
+
+                if low_gain_streak >= self.patience:
+                    stop_reason = "converged"
+                    break
+
+                while next_index < len(candidates) and len(pending) < max_workers:
+                    submit_next()
+        finally:
+            # Do not wait for fetches that are no longer needed
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        elapsed = time.perf_counter() - start
+        skipped = len(candidates) - fetched
+        average = sum(fetch_seconds) / len(fetch_seconds) if fetch_seconds else 0.0
+
+        stats = {
+            "urls_considered": len(candidates),
+            "urls_fetched": fetched,
+            "urls_skipped": skipped,
+            "stop_reason": stop_reason,
+            "elapsed_seconds": round(elapsed, 3),
+            # Chunks are embedded once for scoring and again when they are indexed
+            "scoring_seconds": round(scoring_seconds, 3),
+            # Skipped pages would have been fetched max_workers at a time, minus the extra
+            # embedding pass spent deciding to skip them (negative when it cost more)
+            "estimated_time_saved_seconds": round(skipped * average / max_workers - scoring_seconds, 3),
+            "top_k_min_score": round(top[0][0], 4) if top else None
+        }
+        return documents, stats
+
+    def _process(self, url, query):
+        start = time.perf_counter()
+        try:
+            docs = self.content_processor.process_url(url, query)
+        except Exception as e:
+            logger.error(f"Error processing {url}: {str(e)}")
+            docs = []
+        return docs, time.perf_counter() - start
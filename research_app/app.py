@@ -5,28 +5,62 @@ from flask import Flask, request, jsonify
 from content_processor import ContentProcessor
 from txtai_manager import TxtaiManager
 from gemini_client import GeminiClient
-from searxng_client import SearxngClient
+from searxng_client import SearxngClient, expand_query
+from report_store import ReportStore
+from adaptive_fetcher import AdaptiveFetcher
+import metrics
 import utils
 
 # Setup logging
 logger = utils.setup_logging()
 
+# Storage locations, overridable for local runs and benchmarks
+INDEX_DIR = os.environ.get("INDEX_DIR", "/app/txtai_index")
+DATA_DIR = os.environ.get("DATA_DIR", "/app/data")
+
 # Initialize Flask app
 app = Flask(__name__)
 
 # Initialize components
 content_processor = ContentProcessor()
-txtai_manager = TxtaiManager()
+txtai_manager = TxtaiManager(INDEX_DIR)
 gemini_client = GeminiClient()
 searxng_client = SearxngClient()
+adaptive_fetcher = AdaptiveFetcher(content_processor, txtai_manager)
+report_store = ReportStore(os.path.join(DATA_DIR, "reports.db"))
+# Server errors are not shared with coalesced requests, they run again instead
+single_flight = utils.SingleFlight(
+    wait_timeout=float(os.environ.get("COALESCE_WAIT_TIMEOUT", 900)),
+    failed=lambda result: result[1] >= 500
+)
 
 # Ensure required directories exist
 utils.ensure_directories([
-    "/app/txtai_index",
-    "/app/data",
-    "/app/data/reports"
+    INDEX_DIR,
+    DATA_DIR
 ])
 
+def generate(context, prompt_template=None, mode="single"):
+    """
+    Generate a report with a single Gemini call, or map-reduce over groups of
+    sources when mode is "hierarchical".
+    """
+    if mode == "hierarchical":
+        return gemini_client.generate_report_hierarchical(context, prompt_template)
+    return gemini_client.generate_report(context, prompt_template)
+
+def coalesced_response(endpoint, data, run):
+    """
+    Run a request through the single-flight group so that concurrent requests
+    with the same parameters wait for one execution and share its result.
+    """
+    key = utils.request_key(endpoint, data)
+    (payload, status), shared = single_flight.do(key, run, data)
+    if shared:
+        metrics.record_coalesced(endpoint)
+        payload = {**payload, "coalesced": True}
+    return jsonify(payload), status
+
 @app.route('/')
 def index():
     return jsonify({
@@ -36,7 +70,7 @@ def index():
     })
 
 @app.route('/search', methods=['POST'])
-@utils.timing_decorator
+@metrics.timed_endpoint
 def search():
     """
     Search for information on a topic using SearXNG.
@@ -59,14 +93,15 @@ def search():
             "status": "success",
             "query": query,
             "results": results.get('results', []),
-            "result_count": len(results.get('results', []))
+            "result_count": len(results.get('results', [])),
+            "search_cache": searxng_client.cache.stats()
         })
     except Exception as e:
         logger.error(f"Error in search: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/process', methods=['POST'])
-@utils.timing_decorator
+@metrics.timed_endpoint
 def process_urls():
     """
     Process URLs to extract, clean, and index content.
@@ -77,52 +112,33 @@ def process_urls():
 
     urls = data['urls']
     query = data.get('query', '')  # Original query for context
+    collection = data.get('collection')  # Named collection, defaults to the shared index
 
     try:
         logger.info(f"Processing {len(urls)} URLs")
 
         processed_docs = []
         for url in urls:
-            # Fetch and parse content
-            content, metadata = content_processor.fetch_and_parse(url)
-
-            if not content:
-                logger.warning(f"No content extracted from {url}")
-                continue
-
-            # Clean the text
-            cleaned_text = content_processor.clean_text(content)
-
-            # Chunk the text
-            chunks = content_processor.chunk_text(cleaned_text)
-
-            # Add chunks to processed docs with metadata
-            for i, chunk in enumerate(chunks):
-                chunk_metadata = metadata.copy()
-                chunk_metadata['chunk_id'] = i + 1
-                chunk_metadata['total_chunks'] = len(chunks)
-                chunk_metadata['original_query'] = query
-
-                processed_docs.append({
-                    "text": chunk,
-                    "metadata": chunk_metadata
-                })
+            # Fetch, parse, clean and chunk the content
+            processed_docs.extend(content_processor.process_url(url, query))
 
         # Index the processed documents
-        num_indexed = txtai_manager.index_documents(processed_docs)
+        num_indexed = txtai_manager.index_documents(processed_docs, collection)
 
         return jsonify({
             "status": "success",
             "processed_urls": len(urls),
             "indexed_chunks": num_indexed,
-            "index_info": txtai_manager.get_index_info()
+            "index_info": txtai_manager.get_index_info(collection)
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error in processing: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/retrieve', methods=['POST'])
-@utils.timing_decorator
+@metrics.timed_endpoint
 def retrieve():
     """
     Retrieve relevant information for a query from the txtai index.
@@ -133,80 +149,106 @@ def retrieve():
 
     query = data['query']
     limit = data.get('limit', 10)
+    collections = data.get('collections', data.get('collection'))  # Name, list of names or "*"
 
     try:
         logger.info(f"Retrieving information for: {query}")
 
         # Retrieve relevant documents
-        results = txtai_manager.retrieve(query, limit)
+        skipped = []
+        results = txtai_manager.retrieve(query, limit, collections, skipped)
 
         return jsonify({
             "status": "success",
             "query": query,
             "results": results,
-            "result_count": len(results)
+            "result_count": len(results),
+            "collections_skipped": skipped
         })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error in retrieval: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/generate', methods=['POST'])
-@utils.timing_decorator
+@metrics.timed_endpoint
 def generate_report():
     """
     Generate a comprehensive research report using Gemini.
+    Identical concurrent requests share a single execution.
     """
     data = request.json
     if not data or 'query' not in data:
         return jsonify({"error": "Query parameter is required"}), 400
 
+    return coalesced_response('generate', data, run_generate)
+
+def run_generate(data):
+    """
+    Retrieve context and generate a report. Returns the response payload and status code.
+    """
     query = data['query']
     limit = data.get('limit', 15)  # Number of context documents to retrieve
     prompt_template = data.get('prompt_template')  # Optional custom prompt
+    mode = data.get('mode', 'single')  # "hierarchical" for map-reduce over large contexts
+    collections = data.get('collections', data.get('collection'))  # Name, list of names or "*"
 
     try:
         logger.info(f"Generating report for: {query}")
 
         # Retrieve relevant documents
-        context = txtai_manager.retrieve(query, limit)
+        skipped = []
+        context = txtai_manager.retrieve(query, limit, collections, skipped)
 
         if not context:
-            return jsonify({"error": "No relevant information found. Please process some URLs first."}), 404
+            return {"error": "No relevant information found. Please process some URLs first."}, 404
 
         # Generate report
-        report_result, citations = gemini_client.generate_report(context, prompt_template)
+        report_result, citations = generate(context, prompt_template, mode)
 
         if "error" in report_result:
-            return jsonify({"error": report_result["error"]}), 500
+            return {"error": report_result["error"]}, 500
 
         # Save the research results
-        report_file = utils.save_research_results(query, report_result["report"], citations)
+        report_id = report_store.save(query, report_result["report"], citations)
 
         # Format citations for response
         formatted_citations = utils.format_citations(citations)
 
-        return jsonify({
+        return {
             "status": "success",
             "query": query,
             "report": report_result["report"],
             "citations": formatted_citations,
             "source_count": len(citations),
-            "saved_to": report_file
-        })
+            "generation": {k: v for k, v in report_result.items() if k != "report"},
+            "collections_skipped": skipped,
+            "report_id": report_id
+        }, 200
+    except ValueError as e:
+        return {"error": str(e)}, 400
     except Exception as e:
         logger.error(f"Error generating report: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        return {"error": str(e)}, 500
 
 @app.route('/workflow', methods=['POST'])
-@utils.timing_decorator
+@metrics.timed_endpoint
 def research_workflow():
     """
     Execute the complete research workflow: search, process, and generate report.
+    Identical concurrent requests share a single execution.
     """
     data = request.json
     if not data or 'query' not in data:
         return jsonify({"error": "Query parameter is required"}), 400
 
+    return coalesced_response('workflow', data, run_workflow)
+
+def run_workflow(data):
+    """
+    Run search, processing, retrieval and generation. Returns the response payload and status code.
+    """
     query = data['query']
     max_urls = data.get('max_urls', 10)
     categories = data.get('categories', 'general,science')
@@ -214,67 +256,160 @@ def research_workflow():
     language = data.get('language', 'en')
     time_range = data.get('time_range')
     prompt_template = data.get('prompt_template')
+    limit = data.get('limit', 15)
+    mode = data.get('mode', 'single')
+    adaptive = data.get('adaptive', False)  # Stop fetching once new sources stop adding relevant chunks
+    time_budget = data.get('time_budget')  # Seconds allowed for adaptive fetching
+    fetch_workers = data.get('fetch_workers')  # Concurrent adaptive fetches
+    collection = data.get('collection')  # Collection the fetched pages are indexed into
+    collections = data.get('collections', collection)  # Collections searched for context
+    num_queries = data.get('num_queries', 3)  # Sub-queries generated from the question
+    sub_queries = data.get('sub_queries')  # Explicit sub-queries, overriding the expansion
 
     try:
+        if sub_queries:
+            if not isinstance(sub_queries, list) or not all(isinstance(q, str) and q.strip() for q in sub_queries):
+                raise ValueError("sub_queries must be a list of non-empty strings")
+        else:
+            if isinstance(num_queries, bool) or not isinstance(num_queries, int) or num_queries < 1:
+                raise ValueError("num_queries must be a positive integer")
+            sub_queries = expand_query(query, num_queries)
+        if time_budget is not None and (isinstance(time_budget, bool) or not isinstance(time_budget, (int, float)) or time_budget <= 0):
+            raise ValueError("time_budget must be a positive number")
+        if fetch_workers is not None and (isinstance(fetch_workers, bool) or not isinstance(fetch_workers, int) or fetch_workers < 1):
+            raise ValueError("fetch_workers must be a positive integer")
+
         logger.info(f"Starting research workflow for: {query}")
 
-        # Step 1: Search for information
-        search_results = searxng_client.search(query, categories, engines, language, time_range)
+        # Step 1: Search for information with all sub-queries in parallel
+        search_results = searxng_client.search_many(sub_queries, categories, engines, language, time_range)
         urls = [result['url'] for result in search_results.get('results', [])[:max_urls]]
 
         if not urls:
-            return jsonify({"error": "No search results found."}), 404
+            return {"error": "No search results found."}, 404
 
         # Step 2: Process and index the URLs
-        processed_docs = []
-        for url in urls:
-            content, metadata = content_processor.fetch_and_parse(url)
-            if not content:
-                continue
-
-            cleaned_text = content_processor.clean_text(content)
-            chunks = content_processor.chunk_text(cleaned_text)
-
-            for i, chunk in enumerate(chunks):
-                chunk_metadata = metadata.copy()
-                chunk_metadata['chunk_id'] = i + 1
-                chunk_metadata['total_chunks'] = len(chunks)
-                chunk_metadata['original_query'] = query
-
-                processed_docs.append({
-                    "text": chunk,
-                    "metadata": chunk_metadata
-                })
-
-        num_indexed = txtai_manager.index_documents(processed_docs)
+        if adaptive:
+            processed_docs, adaptive_stats = adaptive_fetcher.fetch(
+                query, search_results.get('results', [])[:max_urls], top_k=limit,
+                time_budget=time_budget, max_workers=fetch_workers
+            )
+        else:
+            adaptive_stats = None
+            processed_docs = []
+            for url in urls:
+                processed_docs.extend(content_processor.process_url(url, query))
+
+        num_indexed = txtai_manager.index_documents(processed_docs, collection)
 
         # Step 3: Retrieve relevant information
-        context = txtai_manager.retrieve(query, 15)
+        skipped = []
+        context = txtai_manager.retrieve(query, limit, collections, skipped)
 
         # Step 4: Generate the report
-        report_result, citations = gemini_client.generate_report(context, prompt_template)
+        report_result, citations = generate(context, prompt_template, mode)
 
         if "error" in report_result:
-            return jsonify({"error": report_result["error"]}), 500
+            return {"error": report_result["error"]}, 500
 
         # Save the research results
-        report_file = utils.save_research_results(query, report_result["report"], citations)
+        report_id = report_store.save(query, report_result["report"], citations)
 
         # Format citations for response
         formatted_citations = utils.format_citations(citations)
 
-        return jsonify({
+        return {
             "status": "success",
             "query": query,
             "report": report_result["report"],
             "citations": formatted_citations,
             "source_count": len(citations),
-            "urls_processed": len(urls),
+            "generation": {k: v for k, v in report_result.items() if k != "report"},
+            "sub_queries": sub_queries,
+            "urls_processed": adaptive_stats["urls_fetched"] if adaptive_stats else len(urls),
             "chunks_indexed": num_indexed,
-            "saved_to": report_file
-        })
+            "adaptive": adaptive_stats,
+            "search_cache": searxng_client.cache.stats(),
+            "collections_skipped": skipped,
+            "report_id": report_id
+        }, 200
+    except ValueError as e:
+        return {"error": str(e)}, 400
     except Exception as e:
         logger.error(f"Error in research workflow: {str(e)}")
+        return {"error": str(e)}, 500
+
+@app.route('/reports', methods=['GET'])
+@metrics.timed_endpoint
+def list_reports():
+    """
+    List saved reports, newest first, optionally filtered by query prefix,
+    cited URL and creation time.
+    """
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        offset = max(0, int(request.args.get('offset', 0)))
+        reports = report_store.list(
+            query=request.args.get('query'),
+            url=request.args.get('url'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            limit=limit,
+            offset=offset
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {str(e)}"}), 400
+    except Exception as e:
+        logger.error(f"Error listing reports: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "status": "success",
+        "reports": reports,
+        "result_count": len(reports),
+        "limit": limit,
+        "offset": offset
+    })
+
+@app.route('/reports/<int:report_id>', methods=['GET'])
+@metrics.timed_endpoint
+def get_report(report_id):
+    """
+    Get a saved report with its citations.
+    """
+    try:
+        report = report_store.get(report_id)
+    except Exception as e:
+        logger.error(f"Error getting report {report_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    if report is None:
+        return jsonify({"error": "Report not found"}), 404
+
+    report["citations"] = utils.format_citations(report["citations"])
+    return jsonify({"status": "success", "report": report})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Expose Prometheus metrics for every pipeline stage.
+    """
+    return metrics.metrics_response()
+
+@app.route('/collections', methods=['GET'])
+def list_collections():
+    """
+    List the index collections and which of them are loaded in memory.
+    """
+    try:
+        return jsonify({
+            "status": "success",
+            "collections": txtai_manager.list_collections(),
+            "default_collection": txtai_manager.default_collection,
+            "loaded_collections": txtai_manager.loaded_collections()
+        })
+    except Exception as e:
+        logger.error(f"Error listing collections: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/index-info', methods=['GET'])
@@ -283,7 +418,7 @@ def index_info():
     Get information about the txtai index.
     """
     try:
-        info = txtai_manager.get_index_info()
+        info = txtai_manager.get_index_info(request.args.get('collection'))
         return jsonify({
             "status": "success",
             "index_info": info
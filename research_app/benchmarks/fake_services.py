@@ -0,0 +1,216 @@
+# Fake services
+# Local stand-ins for SearXNG and the web used by the offline benchmark:
+# a SearXNG-compatible JSON /search endpoint and a generated corpus of HTML
+# and PDF pages served with configurable latency and size.
+
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+TOPICS = [
+    ("quantum computing", ["qubit", "superconducting", "error correction", "entanglement", "decoherence", "gate fidelity"]),
+    ("climate adaptation", ["drought", "crop yield", "sea level", "irrigation", "heatwave", "resilience"]),
+    ("language models", ["transformer", "pretraining", "benchmark", "alignment", "tokenizer", "inference"]),
+    ("battery storage", ["lithium", "solid state", "grid", "cathode", "energy density", "cycle life"]),
+    ("gene editing", ["crispr", "off-target", "germline", "therapy", "cas9", "delivery vector"]),
+]
+
+FILLER = (
+    "the study reports that researchers observed significant results across several independent trials "
+    "while further analysis suggests important limitations in current methods and future work should "
+    "address scalability cost and reproducibility in real world deployments according to recent surveys"
+).split()
+
+
+def _sentence(rng, keywords):
+    words = rng.sample(FILLER, 12)
+    for _ in range(3):
+        words.insert(rng.randrange(len(words)), rng.choice(keywords))
+    return " ".join(words).capitalize() + "."
+
+
+def generate_paragraphs(rng, topic, keywords, size_bytes):
+    """
+    Generate paragraphs of pseudo-text about a topic totalling roughly size_bytes
+    """
+    paragraphs = []
+    total = 0
+    while total < size_bytes:
+        paragraph = " ".join(_sentence(rng, [topic] + keywords) for _ in range(rng.randint(3, 6)))
+        paragraphs.append(paragraph)
+        total += len(paragraph)
+    return paragraphs
+
+
+def build_html(title, paragraphs):
+    body = "\n".join(f"<p>{p}</p>" for p in paragraphs)
+    return (
+        f"<html><head><title>{title}</title><style>p {{ margin: 0 }}</style></head>"
+        f"<body><nav>Home | About</nav><h1>{title}</h1>\n{body}\n"
+        f"<footer>Benchmark corpus</footer><script>var x = 1;</script></body></html>"
+    ).encode("utf-8")
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(title, paragraphs, line_width=90, lines_per_page=50):
+    """
+    Build a minimal multi-page PDF containing the given text
+    """
+    lines = [title, ""]
+    for paragraph in paragraphs:
+        words = paragraph.split()
+        line = ""
+        for word in words:
+            if len(line) + len(word) + 1 > line_width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+        lines.append("")
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    # Object numbers: 1 catalog, 2 page tree, 3 font, then a page and content stream per page
+    objects = {}
+    kids = []
+    for n, page_lines in enumerate(pages):
+        page_obj, content_obj = 4 + 2 * n, 5 + 2 * n
+        kids.append(f"{page_obj} 0 R")
+        text_ops = "".join(f"({_pdf_escape(line)}) '\n" for line in page_lines)
+        stream = f"BT /F1 10 Tf 14 TL 50 780 Td\n{text_ops}ET".encode("latin-1", "replace")
+        objects[page_obj] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_obj} 0 R >>"
+        ).encode()
+        objects[content_obj] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+    objects[3] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(output)
+        output += b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for number in sorted(objects):
+        output += b"%010d 00000 n \n" % offsets[number]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(output)
+
+
+class Corpus:
+    """
+    Deterministic set of generated pages, one topic per page
+    """
+    def __init__(self, num_pages=40, page_kb=20, pdf_ratio=0.2, seed=42):
+        rng = random.Random(seed)
+        self.pages = {}
+        for n in range(num_pages):
+            topic, keywords = TOPICS[n % len(TOPICS)]
+            is_pdf = rng.random() < pdf_ratio
+            title = f"{topic.title()} report {n}"
+            paragraphs = generate_paragraphs(rng, topic, keywords, page_kb * 1024)
+            path = f"/corpus/{n}.pdf" if is_pdf else f"/corpus/{n}.html"
+            if is_pdf:
+                self.pages[path] = ("application/pdf", build_pdf(title, paragraphs), topic, title)
+            else:
+                self.pages[path] = ("text/html; charset=utf-8", build_html(title, paragraphs), topic, title)
+
+    def paths(self):
+        return sorted(self.pages, key=lambda p: int(p.split("/")[-1].split(".")[0]))
+
+    def search(self, query, count):
+        """
+        Rank pages for a query: pages on a matching topic first, then a
+        query-dependent but stable selection of the rest
+        """
+        query = query.lower()
+        rng = random.Random(zlib.crc32(query.encode("utf-8")))
+        scored = []
+        for path, (_, _, topic, title) in self.pages.items():
+            overlap = sum(1 for word in topic.split() if word in query)
+            scored.append((overlap + rng.random(), path, title))
+        scored.sort(reverse=True)
+        return scored[:count]
+
+
+class FakeServices:
+    """
+    HTTP server acting as both SearXNG (/search) and the web (/corpus/...)
+    """
+    def __init__(self, corpus, host="127.0.0.1", port=0, page_latency_ms=50, page_jitter_ms=25,
+                 search_latency_ms=100, results_per_query=10):
+        self.corpus = corpus
+        self.page_latency = page_latency_ms / 1000
+        self.page_jitter = page_jitter_ms / 1000
+        self.search_latency = search_latency_ms / 1000
+        self.results_per_query = results_per_query
+        self.requests = {"search": 0, "page": 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path == "/search":
+                    services._count("search")
+                    time.sleep(services.search_latency)
+                    query = parse_qs(parsed.query).get("q", [""])[0]
+                    results = [
+                        {"url": f"{services.base_url}{path}", "title": title, "content": "", "score": round(score, 4),
+                         "engine": "fake", "engines": ["fake"]}
+                        for score, path, title in services.corpus.search(query, services.results_per_query)
+                    ]
+                    body = json.dumps({"query": query, "number_of_results": len(results), "results": results})
+                    self._send(200, "application/json", body.encode("utf-8"))
+                elif parsed.path in services.corpus.pages:
+                    services._count("page")
+                    time.sleep(max(0.0, services.page_latency + random.uniform(-1, 1) * services.page_jitter))
+                    content_type, body, _, _ = services.corpus.pages[parsed.path]
+                    self._send(200, content_type, body)
+                else:
+                    self._send(404, "text/plain", b"not found")
+
+        return Handler
@@ -0,0 +1,255 @@
+# Offline pipeline benchmark
+# Boots the app against a fake SearXNG, a generated local corpus and a
+# stubbed Gemini completion, replays a workload of API calls and stores
+# throughput, latency percentiles, peak RSS and per-stage time as JSON.
+#
+# Usage:
+#   python benchmarks/pipeline_bench.py
+#   python benchmarks/pipeline_bench.py --workload benchmarks/workloads/default.json --page-latency-ms 100
+#   python benchmarks/pipeline_bench.py --compare benchmarks/results/<previous run>.json
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from prometheus_client.parser import text_string_to_metric_families
+from fake_services import Corpus, FakeServices, TOPICS
+from retrieve_load import percentile, wait_until_ready
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+
+QUERIES = [f"{topic} {keyword}" for topic, keywords in TOPICS for keyword in keywords]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def scrape_stages(url):
+    """
+    Read cumulative per-stage seconds and call counts from /metrics
+    """
+    stages = {}
+    text = requests.get(f"{url}/metrics", timeout=10).text
+    for family in text_string_to_metric_families(text):
+        if family.name != "research_stage_seconds":
+            continue
+        for sample in family.samples:
+            entry = stages.setdefault(sample.labels["stage"], {"seconds": 0.0, "count": 0})
+            if sample.name.endswith("_sum"):
+                entry["seconds"] = sample.value
+            elif sample.name.endswith("_count"):
+                entry["count"] = int(sample.value)
+    return stages
+
+
+def peak_rss_mb(pid):
+    """
+    High-water mark of the app's resident memory, read from /proc while it runs
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def build_requests(phase, corpus_urls):
+    """
+    Expand a workload phase into request bodies, filling in queries and
+    corpus URLs that the phase does not specify
+    """
+    bodies = []
+    per_request = phase.get("urls_per_request", 5)
+    for i in range(phase.get("requests", 1)):
+        body = dict(phase.get("body", {}))
+        body.setdefault("query", QUERIES[i % len(QUERIES)])
+        if phase["endpoint"] == "/process" and "urls" not in body:
+            start = (i * per_request) % len(corpus_urls)
+            body["urls"] = [corpus_urls[(start + n) % len(corpus_urls)] for n in range(per_request)]
+        bodies.append(body)
+    return bodies
+
+
+def run_phase(url, phase, corpus_urls):
+    endpoint = phase["endpoint"]
+    bodies = build_requests(phase, corpus_urls)
+    session = requests.Session()
+
+    def call(body):
+        start = time.perf_counter()
+        try:
+            status = session.post(f"{url}{endpoint}", json=body, timeout=600).status_code
+        except requests.RequestException:
+            status = None
+        return status, time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=phase.get("concurrency", 1)) as executor:
+        outcomes = list(executor.map(call, bodies))
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed for status, elapsed in outcomes if status == 200]
+    return {
+        "name": phase.get("name", endpoint),
+        "endpoint": endpoint,
+        "requests": len(outcomes),
+        "errors": len(outcomes) - len(latencies),
+        "concurrency": phase.get("concurrency", 1),
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def compare(current, baseline_path):
+    """
+    Print the change of each phase's throughput and latency against a previous run
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {phase["name"]: phase for phase in baseline.get("phases", [])}
+    print(f"\nCompared with {baseline.get('commit', '?')} ({baseline_path}):")
+    for phase in current["phases"]:
+        base = previous.get(phase["name"])
+        if not base:
+            continue
+        deltas = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if base[key]:
+                deltas.append(f"{key} {100 * (phase[key] - base[key]) / base[key]:+.1f}%")
+        print(f"  {phase['name']:<12} " + "  ".join(deltas))
+    if baseline.get("peak_rss_mb") and current.get("peak_rss_mb"):
+        print(f"  peak_rss_mb  {baseline['peak_rss_mb']} -> {current['peak_rss_mb']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the research pipeline")
+    parser.add_argument("--workload", default=os.path.join(BENCH_DIR, "workloads", "default.json"))
+    parser.add_argument("--pages", type=int, default=40, help="Number of corpus pages")
+    parser.add_argument("--page-kb", type=int, default=20, help="Approximate text size of each page")
+    parser.add_argument("--pdf-ratio", type=float, default=0.2, help="Fraction of pages served as PDF")
+    parser.add_argument("--page-latency-ms", type=float, default=50)
+    parser.add_argument("--page-jitter-ms", type=float, default=25)
+    parser.add_argument("--search-latency-ms", type=float, default=100)
+    parser.add_argument("--results-per-query", type=int, default=10)
+    parser.add_argument("--token-rate", type=float, default=200, help="Stubbed Gemini tokens per second")
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--output-tokens", type=int, default=600)
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--output-dir", default=os.path.join(BENCH_DIR, "results"))
+    parser.add_argument("--label", default="", help="Free-form label stored with the results")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    with open(args.workload, encoding="utf-8") as f:
+        workload = json.load(f)
+
+    corpus = Corpus(num_pages=args.pages, page_kb=args.page_kb, pdf_ratio=args.pdf_ratio)
+    services = FakeServices(
+        corpus, page_latency_ms=args.page_latency_ms, page_jitter_ms=args.page_jitter_ms,
+        search_latency_ms=args.search_latency_ms, results_per_query=args.results_per_query
+    ).start()
+    corpus_urls = [f"{services.base_url}{path}" for path in corpus.paths()]
+
+    workdir = tempfile.mkdtemp(prefix="research_bench_")
+    env = dict(
+        os.environ,
+        SEARXNG_HOST=services.base_url,
+        INDEX_DIR=os.path.join(workdir, "txtai_index"),
+        DATA_DIR=os.path.join(workdir, "data"),
+    )
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    url = f"http://127.0.0.1:{args.port}"
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "stub_app.py"), "--port", str(args.port),
+         "--token-rate", str(args.token_rate), "--first-token-ms", str(args.first_token_ms),
+         "--output-tokens", str(args.output_tokens)],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    try:
+        if not wait_until_ready(url, args.startup_timeout):
+            sys.exit("App did not become ready")
+
+        stages_before = scrape_stages(url)
+        started = time.perf_counter()
+        phases = []
+        for phase in workload["phases"]:
+            result = run_phase(url, phase, corpus_urls)
+            phases.append(result)
+            print(f"{result['name']:<12} {result['requests']:>5} req  {result['errors']:>3} err  "
+                  f"{result['throughput_rps']:>8} req/s  p50={result['p50_ms']} ms  "
+                  f"p95={result['p95_ms']} ms  p99={result['p99_ms']} ms")
+        total_wall = time.perf_counter() - started
+        stages_after = scrape_stages(url)
+        rss = peak_rss_mb(process.pid)
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+        services.stop()
+
+    if rss is None:
+        # ru_maxrss is reported in kilobytes on Linux
+        rss = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+
+    stages = {}
+    for name, after in stages_after.items():
+        before = stages_before.get(name, {"seconds": 0.0, "count": 0})
+        stages[name] = {
+            "seconds": round(after["seconds"] - before["seconds"], 4),
+            "count": after["count"] - before["count"],
+        }
+
+    results = {
+        "commit": git_commit(),
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "workload": os.path.basename(args.workload),
+        "config": {key: value for key, value in vars(args).items() if key not in ("compare", "output_dir", "label")},
+        "total_wall_seconds": round(total_wall, 3),
+        "total_requests": sum(p["requests"] for p in phases),
+        "throughput_rps": round(sum(p["requests"] - p["errors"] for p in phases) / total_wall, 3),
+        "peak_rss_mb": rss,
+        "phases": phases,
+        "stages": stages,
+        "fake_service_requests": dict(services.requests),
+    }
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_file = os.path.join(
+        args.output_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{results['commit']}.json"
+    )
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\npeak RSS {rss} MB, {results['throughput_rps']} req/s overall")
+    for name, entry in sorted(stages.items(), key=lambda item: -item[1]["seconds"]):
+        print(f"  {name:<12} {entry['seconds']:>10.3f} s  over {entry['count']} calls")
+    print(f"Results written to {output_file}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# Retrieve load test
+# Starts the app under gunicorn with an increasing number of workers, indexes
+# a generated corpus into a temporary index and measures /retrieve throughput
+# and latency for each worker count.
+#
+# Usage:
+#   python benchmarks/retrieve_load.py --workers 1,2,4 --concurrency 16 --duration 30
+#   python benchmarks/retrieve_load.py --url http://localhost:5000   # existing, already filled server
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from fake_services import Corpus, FakeServices
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_QUERIES = [
+    "quantum computing error correction",
+    "climate change impact on agriculture",
+    "large language model evaluation",
+    "renewable energy storage technologies",
+    "gene editing ethics",
+]
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of an unsorted list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def wait_until_ready(url, timeout):
+    """
+    Poll the health endpoint until the server answers (model loading can take a while)
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/", timeout=2).ok:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def run_load(url, queries, concurrency, duration, limit):
+    """
+    Hammer /retrieve from several client threads and collect per-request latencies
+    """
+    latencies = []
+    errors = 0
+    empty = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(worker_id):
+        nonlocal errors, empty
+        session = requests.Session()
+        i = worker_id
+        while time.perf_counter() < deadline:
+            query = queries[i % len(queries)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                resp = session.post(f"{url}/retrieve", json={"query": query, "limit": limit}, timeout=60)
+                ok = resp.status_code == 200
+                hits = resp.json().get("result_count", 0) if ok else 0
+            except (requests.RequestException, ValueError):
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                    empty += not hits
+                else:
+                    errors += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "empty": empty,
+        "qps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def ingest(url, corpus_urls, batch_size=5):
+    """
+    Index the corpus through /process so that /retrieve searches a real index
+    """
+    session = requests.Session()
+    indexed = 0
+    for i in range(0, len(corpus_urls), batch_size):
+        resp = session.post(f"{url}/process", json={"urls": corpus_urls[i:i + batch_size]}, timeout=600)
+        resp.raise_for_status()
+        indexed += resp.json().get("indexed_chunks", 0)
+    return indexed
+
+
+def check_results(url, queries, limit):
+    """
+    Return the queries for which /retrieve finds nothing
+    """
+    missing = []
+    for query in queries:
+        resp = requests.post(f"{url}/retrieve", json={"query": query, "limit": limit}, timeout=60)
+        if resp.status_code != 200 or not resp.json().get("result_count"):
+            missing.append(query)
+    return missing
+
+
+def start_server(workers, threads, port, env=None):
+    env = dict(env or os.environ, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads))
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+         "--bind", f"127.0.0.1:{port}", "--workers", str(workers), "app:app"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure /retrieve QPS and p99 latency by worker count")
+    parser.add_argument("--url", help="Benchmark an already running server instead of starting gunicorn")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts to test")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per gunicorn worker")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client threads")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load per run")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds of unmeasured load per run")
+    parser.add_argument("--limit", type=int, default=10, help="Results per /retrieve call")
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    parser.add_argument("--pages", type=int, default=40, help="Number of corpus pages indexed before the runs")
+    parser.add_argument("--page-kb", type=int, default=20, help="Approximate text size of each page")
+    parser.add_argument("--pdf-ratio", type=float, default=0.2, help="Fraction of pages served as PDF")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    runs = []
+    services = None
+    env = None
+    corpus_urls = []
+    if args.url:
+        targets = [(None, args.url.rstrip("/"))]
+    else:
+        targets = [(int(w), f"http://127.0.0.1:{args.port}") for w in args.workers.split(",")]
+
+        # Serve a generated corpus and index it into a temporary directory; the
+        # index is saved, so servers with other worker counts load the same data
+        corpus = Corpus(num_pages=args.pages, page_kb=args.page_kb, pdf_ratio=args.pdf_ratio)
+        services = FakeServices(corpus, page_latency_ms=0, page_jitter_ms=0, search_latency_ms=0).start()
+        corpus_urls = [f"{services.base_url}{path}" for path in corpus.paths()]
+        workdir = tempfile.mkdtemp(prefix="retrieve_load_")
+        env = dict(
+            os.environ,
+            SEARXNG_HOST=services.base_url,
+            INDEX_DIR=os.path.join(workdir, "txtai_index"),
+            DATA_DIR=os.path.join(workdir, "data"),
+        )
+
+    for workers, url in targets:
+        process = start_server(workers, args.threads, args.port, env) if workers else None
+        try:
+            if not wait_until_ready(url, args.startup_timeout):
+                print(f"Server with {workers} workers did not become ready", file=sys.stderr)
+                continue
+            if corpus_urls:
+                print(f"Indexed {ingest(url, corpus_urls)} chunks from {len(corpus_urls)} pages")
+                corpus_urls = []
+            missing = check_results(url, DEFAULT_QUERIES, args.limit)
+            if missing:
+                sys.exit(f"/retrieve returned no results for {len(missing)} queries, the index is empty")
+            if args.warmup:
+                run_load(url, DEFAULT_QUERIES, args.concurrency, args.warmup, args.limit)
+            result = run_load(url, DEFAULT_QUERIES, args.concurrency, args.duration, args.limit)
+            result["workers"] = workers
+            runs.append(result)
+            print(f"workers={workers or '-':>3}  qps={result['qps']:>8}  p50={result['p50_ms']:>8} ms  "
+                  f"p99={result['p99_ms']:>8} ms  errors={result['errors']}  empty={result['empty']}")
+        finally:
+            if process:
+                process.send_signal(signal.SIGTERM)
+                process.wait(timeout=60)
+
+    if services:
+        services.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"concurrency": args.concurrency, "duration": args.duration, "runs": runs}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Stubbed app server
+# Runs the research app with litellm's completion replaced by a local stub
+# that emits tokens at a configurable rate, so no Gemini key or network
+# access is needed. Started as a subprocess by pipeline_bench.py.
+
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_completion(token_rate, first_token_ms, output_tokens):
+    """
+    Build a stand-in for litellm.completion that sleeps for the time a model
+    emitting token_rate tokens per second would take
+    """
+    def completion(model, messages, max_tokens=4096, **kwargs):
+        prompt = " ".join(m["content"] for m in messages)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = min(max_tokens, output_tokens)
+        time.sleep(first_token_ms / 1000 + completion_tokens / token_rate)
+
+        words = ["Findings", "indicate", "consistent", "evidence", "across", "sources", "[1]", "and", "[2]."]
+        content = " ".join(words[i % len(words)] for i in range(completion_tokens))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        )
+    return completion
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the app with a stubbed Gemini completion")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--token-rate", type=float, default=200, help="Generated tokens per second")
+    parser.add_argument("--first-token-ms", type=float, default=300, help="Latency before the first token")
+    parser.add_argument("--output-tokens", type=int, default=600, help="Tokens generated per call")
+    args = parser.parse_args()
+
+    sys.path.insert(0, APP_DIR)
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+    import gemini_client
+    gemini_client.completion = make_completion(args.token_rate, args.first_token_ms, args.output_tokens)
+
+    import app
+    from werkzeug.serving import make_server
+
+    server = make_server(args.host, args.port, app.app, threaded=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,22 @@
-# Content Processor# Functions for fetching, parsing, cleaning, and chunking content from URLs.import requestsimport httpxfrom bs4 import BeautifulSoupimport reimport fitz  # PyMuPDFimport PyPDF2import pdfplumberfrom txtai.pipeline import Textractorfrom urllib.parse import urlparseimport logginglogger = logging.getLogger(__name__)
+# Content Processor
+# Functions for fetching, parsing, cleaning, and chunking content from URLs.
+
+import requests
+import httpx
+from bs4 import BeautifulSoup
+import re
+import time
+from datetime import datetime, timezone
+import fitz  # PyMuPDF
+import PyPDF2
+import pdfplumber
+from txtai.pipeline import Textractor
+from urllib.parse import urlparse
+import logging
+import metrics
+
+logger = logging.getLogger(__name__)
+
 class ContentProcessor:
     def __init__(self):
         self.textractor = Textractor(sentences=True)
@@ -25,26 +43,29 @@ class ContentProcessor:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
+        start = time.perf_counter()
         response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
+        metrics.record_fetch(url, time.perf_counter() - start, len(response.content), 'html')
         
-        soup = BeautifulSoup(response.content, 'lxml')
-        
-        # Extract the title
-        title = soup.title.text.strip() if soup.title else "Untitled"
-        
-        # Remove script, style, and hidden elements
-        for element in soup(['script', 'style', 'head', 'header', 'footer', 'nav']):
-            element.decompose()
+        with metrics.stage("parse"):
+            soup = BeautifulSoup(response.content, 'lxml')
+            
+            # Extract the title
+            title = soup.title.text.strip() if soup.title else "Untitled"
             
-        # Get the main text content
-        text = soup.get_text(separator=' ', strip=True)
+            # Remove script, style, and hidden elements
+            for element in soup(['script', 'style', 'head', 'header', 'footer', 'nav']):
+                element.decompose()
+                
+            # Get the main text content
+            text = soup.get_text(separator=' ', strip=True)
         
         metadata = {
             'title': title,
             'url': url,
             'source_type': 'html',
-            'retrieval_date': str(requests.utils.default_headers()['Date'])
+            'retrieval_date': self._retrieval_date(response)
         }
         
         return text, metadata
@@ -54,11 +75,16 @@ class ContentProcessor:
         Fetch and parse PDF content
         """
         # Download the PDF
+        start = time.perf_counter()
         response = requests.get(url, stream=True)
         response.raise_for_status()
+        content = response.content
+        metrics.record_fetch(url, time.perf_counter() - start, len(content), 'pdf')
         
-        # Using textractor to extract PDF content
-        text = self.textractor(response.content, content_type="application/pdf")
+        # Extract the text of each page with PyMuPDF
+        with metrics.stage("parse"):
+            with fitz.open(stream=content, filetype="pdf") as document:
+                text = "\n\n".join(page.get_text() for page in document)
         
         # Extracting basic metadata
         title = url.split('/')[-1].replace('.pdf', '') if url else "Untitled PDF"
@@ -67,11 +93,51 @@ class ContentProcessor:
             'title': title,
             'url': url,
             'source_type': 'pdf',
-            'retrieval_date': str(requests.utils.default_headers()['Date'])
+            'retrieval_date': self._retrieval_date(response)
         }
         
         return text, metadata
+    
+    def _retrieval_date(self, response):
+        """
+        Use the server's Date header, falling back to the local clock
+        """
+        return response.headers.get('Date') or datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+        
+    def process_url(self, url, query=""):
+        """
+        Fetch, clean and chunk a URL into documents ready for indexing
+        
+        Args:
+            url: The URL to process
+            query: Original research query, stored with each chunk
+            
+        Returns:
+            List of document dictionaries with text and metadata
+        """
+        content, metadata = self.fetch_and_parse(url)
+        if not content:
+            logger.warning(f"No content extracted from {url}")
+            return []
+        
+        cleaned_text = self.clean_text(content)
+        chunks = self.chunk_text(cleaned_text)
+        
+        documents = []
+        for i, chunk in enumerate(chunks):
+            chunk_metadata = metadata.copy()
+            chunk_metadata['chunk_id'] = i + 1
+            chunk_metadata['total_chunks'] = len(chunks)
+            chunk_metadata['original_query'] = query
+            
+            documents.append({
+                "text": chunk,
+                "metadata": chunk_metadata
+            })
+        
+        return documents
         
+    @metrics.timed_stage("clean")
     def clean_text(self, text):
         """
         Clean the extracted text by removing excess whitespace, special characters, etc.
@@ -90,6 +156,7 @@ class ContentProcessor:
         
         return text.strip()
         
+    @metrics.timed_stage("chunk")
     def chunk_text(self, text, chunk_size=1000, overlap=100):
         """
         Split the text into chunks with semantic awareness
@@ -154,4 +221,5 @@ class ContentProcessor:
                 if current_chunk:
                     final_chunks.append(current_chunk.strip())
                     
+        metrics.record_chunks(len(final_chunks))
         return final_chunks
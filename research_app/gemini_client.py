@@ -4,13 +4,17 @@
 import os
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import litellm
 from litellm import completion
+import metrics
+from utils import RateLimiter
 
 logger = logging.getLogger(__name__)
 
 class GeminiClient:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, concurrency=None, requests_per_minute=None):
         """
         Initialize the Gemini client with API key from environment variable or parameter
         """
@@ -21,6 +25,14 @@ class GeminiClient:
         # Configure litellm to use Gemini
         litellm.api_key = self.api_key
 
+        # Limits for the concurrent Gemini calls of all requests served by this process
+        self.concurrency = concurrency or int(os.environ.get("GEMINI_CONCURRENCY", 4))
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        # Optional per-process request rate cap; the burst lets a full map step start at once
+        rpm = requests_per_minute if requests_per_minute is not None else int(os.environ.get("GEMINI_RPM", 0))
+        burst = max(self.concurrency, int(os.environ.get("GEMINI_BURST", 0)))
+        self.rate_limiter = RateLimiter(rpm, burst=burst) if rpm else None
+
     def generate_report(self, context, prompt_template=None, max_tokens=4096):
         """
         Generate a research report using the Google Gemini API
@@ -48,35 +60,149 @@ class GeminiClient:
             prompt = prompt_template.format(context=formatted_context)
 
             # Call Gemini API via LiteLLM
-            response = completion(
-                model="gemini-pro",  # Using Gemini Pro model
-                messages=[
-                    {"role": "system", "content": "You are a thorough research assistant that synthesizes information into comprehensive reports with accurate citations."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=0.3,  # Lower temperature for more factual responses
-            )
-
-            # Extract report content from response
-            report_content = response.choices[0].message.content
+            report_content = self._complete(prompt, max_tokens)
 
             # Prepare citation information from context
             citations = self._prepare_citations(context)
 
-            return {"report": report_content}, citations
+            return {"report": report_content, "mode": "single", "depth": 1, "calls": 1}, citations
 
         except Exception as e:
             logger.error(f"Error generating report with Gemini: {str(e)}")
             return {"error": f"Failed to generate report: {str(e)}"}, []
 
-    def _format_context(self, context):
+    def generate_report_hierarchical(self, context, prompt_template=None, max_tokens=4096,
+                                     summary_max_tokens=1024, max_group_chars=12000, fanout=8):
         """
-        Format the retrieved context for the prompt
+        Generate a research report in map-reduce fashion for large contexts.
+
+        Retrieved chunks are grouped by source and packed into groups of at most
+        max_group_chars characters. The groups are summarized with concurrent
+        Gemini calls, summaries are combined fanout at a time until at most
+        fanout remain, and a final call synthesizes the report. Sources keep
+        the numbers they have in the single-prompt mode, so [X] citations in
+        the report refer to the same citations list.
+
+        Args:
+            context: List of retrieved documents with text and metadata
+            prompt_template: Optional template for the final synthesis prompt
+            max_tokens: Maximum tokens for the final report
+            summary_max_tokens: Maximum tokens for each intermediate summary
+            max_group_chars: Maximum context characters sent in one summary call
+            fanout: Maximum number of summaries combined in one call
+
+        Returns:
+            Generated report with generation statistics, and citation information
         """
-        formatted_texts = []
+        if not self.api_key:
+            return {"error": "No API key provided for Gemini"}, []
+
+        try:
+            groups = self._group_context(context, max_group_chars)
+            calls = len(groups)
+
+            # Map: summarize each group of sources concurrently
+            summaries = self._complete_many(
+                [self._get_summary_prompt_template().format(context=group) for group in groups],
+                summary_max_tokens
+            )
+            depth = 1
+
+            # Reduce: combine summaries until they fit in a single synthesis call
+            while len(summaries) > fanout:
+                batches = [summaries[i:i + fanout] for i in range(0, len(summaries), fanout)]
+                summaries = self._complete_many(
+                    [self._get_combine_prompt_template().format(context="\n\n".join(batch)) for batch in batches],
+                    summary_max_tokens
+                )
+                calls += len(batches)
+                depth += 1
+
+            # Final synthesis over the remaining summaries
+            if not prompt_template:
+                prompt_template = self._get_default_prompt_template()
+            report_content = self._complete(prompt_template.format(context="\n\n".join(summaries)), max_tokens)
+            calls += 1
+            depth += 1
+
+            citations = self._prepare_citations(context)
+
+            return {"report": report_content, "mode": "hierarchical", "depth": depth, "calls": calls}, citations
 
+        except Exception as e:
+            logger.error(f"Error generating hierarchical report with Gemini: {str(e)}")
+            return {"error": f"Failed to generate report: {str(e)}"}, []
+
+    def _group_context(self, context, max_group_chars):
+        """
+        Group formatted sources by URL and pack whole sources into groups of
+        bounded size. A single source larger than the limit is split across groups.
+        """
+        by_source = {}
         for i, doc in enumerate(context):
+            source = doc.get("metadata", {}).get("url") or f"Source {i+1}"
+            by_source.setdefault(source, []).append(self._format_context([doc], start=i + 1))
+
+        groups = []
+        current = []
+        current_size = 0
+        for texts in by_source.values():
+            size = sum(len(t) for t in texts)
+            if current and current_size + size > max_group_chars:
+                groups.append("\n".join(current))
+                current, current_size = [], 0
+            for text in texts:
+                if current and current_size + len(text) > max_group_chars:
+                    groups.append("\n".join(current))
+                    current, current_size = [], 0
+                current.append(text)
+                current_size += len(text)
+        if current:
+            groups.append("\n".join(current))
+        return groups
+
+    def _complete_many(self, prompts, max_tokens):
+        """
+        Run several prompts concurrently, bounded by the configured concurrency.
+        Results are returned in prompt order.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(prompts)))) as executor:
+            futures = [metrics.submit(executor, self._complete, prompt, max_tokens) for prompt in prompts]
+            return [future.result() for future in futures]
+
+    def _complete(self, prompt, max_tokens):
+        """
+        Send a single prompt to Gemini and return the generated text
+        """
+        with self._slots:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+
+            with metrics.stage("gemini"):
+                response = completion(
+                    model="gemini-pro",  # Using Gemini Pro model
+                    messages=[
+                        {"role": "system", "content": "You are a thorough research assistant that synthesizes information into comprehensive reports with accurate citations."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=max_tokens,
+                    temperature=0.3,  # Lower temperature for more factual responses
+                )
+
+        usage = getattr(response, "usage", None)
+        if usage:
+            metrics.record_tokens(getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+
+        # Extract report content from response
+        return response.choices[0].message.content
+
+    def _format_context(self, context, start=1):
+        """
+        Format the retrieved context for the prompt, numbering sources from start
+        """
+        formatted_texts = []
+
+        for i, doc in enumerate(context, start - 1):
             text = doc.get("text", "")
             metadata = doc.get("metadata", {})
             source = metadata.get("url", f"Source {i+1}")
@@ -130,3 +256,33 @@ class GeminiClient:
         - Conclusion summarizing key findings and implications
         - Properly cited sources throughout using the source numbers provided
         """
+
+    def _get_summary_prompt_template(self):
+        """
+        Return the prompt template for summarizing one group of sources
+        """
+        return """
+        Summarize the key facts, findings and arguments in the following information sources.
+        Be specific and keep numbers, names and dates.
+
+        Every statement must cite the source it comes from using the source number in
+        square brackets exactly as given below, for example [3]. Never renumber sources.
+
+        INFORMATION SOURCES:
+        {context}
+        """
+
+    def _get_combine_prompt_template(self):
+        """
+        Return the prompt template for merging several partial summaries
+        """
+        return """
+        Merge the following partial research summaries into a single summary.
+        Remove repetition but keep every distinct fact.
+
+        Keep the source citations in square brackets, for example [3], exactly as they
+        appear. Never renumber or drop citations.
+
+        PARTIAL SUMMARIES:
+        {context}
+        """
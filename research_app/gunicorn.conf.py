@@ -0,0 +1,47 @@
+# Gunicorn configuration for production serving
+# The app is imported once in the master process, so the embedding model and
+# index are loaded before the workers fork and their pages are shared
+# copy-on-write between workers.
+
+import gc
+import multiprocessing
+import os
+import shutil
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+preload_app = True
+
+# Research workflows fetch many pages and call Gemini, so allow long requests
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+# Avoid oversubscribing the CPU: split torch/BLAS threads between workers and
+# disable tokenizer threads, which are not fork-safe. This must happen before
+# the app (and torch) is imported.
+os.environ.setdefault("OMP_NUM_THREADS", str(max(1, multiprocessing.cpu_count() // workers)))
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# Workers write their metrics to a shared directory that /metrics aggregates.
+# It is wiped on startup so counters from a previous run are not reported.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the garbage collector's reach so
+    # collections in the workers do not touch (and copy) the shared pages
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,200 @@
+# Metrics
+# Prometheus metrics and per-request stage timing for the research pipeline.
+
+import os
+import json
+import time
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from flask import request, current_app, Response
+from prometheus_client import (
+    Counter, Histogram, Summary, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+logger = logging.getLogger(__name__)
+
+# Buckets spanning in-memory cache hits up to multi-minute Gemini calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_SECONDS = Histogram(
+    "research_request_seconds", "Endpoint latency in seconds", ["endpoint", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "research_stage_seconds", "Pipeline stage latency in seconds", ["stage"], buckets=LATENCY_BUCKETS
+)
+# Hosts come from arbitrary search results, so they only get a count and sum and the
+# number of distinct labels is capped; the fetch stage histogram has the full buckets
+FETCH_SECONDS = Summary("research_fetch_seconds", "Page fetch latency in seconds per host", ["host"])
+FETCH_MAX_HOSTS = int(os.environ.get("METRICS_MAX_FETCH_HOSTS", 50))
+FETCH_BYTES = Counter("research_fetch_bytes", "Bytes fetched from source pages", ["source_type"])
+CHUNKS = Counter("research_chunks", "Text chunks produced by the content processor")
+LLM_TOKENS = Counter("research_llm_tokens", "Tokens sent to and received from Gemini", ["direction"])
+CACHE_LOOKUPS = Counter("research_cache_lookups", "Cache lookups by cache and result", ["cache", "result"])
+COALESCED_REQUESTS = Counter(
+    "research_coalesced_requests", "Requests answered by sharing an identical in-flight execution", ["endpoint"]
+)
+
+_fetch_hosts = set()
+_fetch_hosts_lock = threading.Lock()
+
+# Stage timings of the current request, only set when the debug flag is on
+_breakdown = contextvars.ContextVar("stage_breakdown", default=None)
+
+
+class StageBreakdown:
+    """
+    Accumulates stage timings for a single request, including work done in
+    worker threads started with submit()
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, name, seconds):
+        with self._lock:
+            entry = self._stages.setdefault(name, {"seconds": 0.0, "count": 0})
+            entry["seconds"] += seconds
+            entry["count"] += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                name: {"seconds": round(entry["seconds"], 4), "count": entry["count"]}
+                for name, entry in self._stages.items()
+            }
+
+
+def observe_stage(name, seconds):
+    """
+    Record the duration of a pipeline stage
+    """
+    STAGE_SECONDS.labels(name).observe(seconds)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time the enclosed block as a pipeline stage
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def timed_stage(name):
+    """
+    Decorator timing every call of the wrapped function as a pipeline stage
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _host_label(url):
+    """
+    Return the host of a URL, or "other" once FETCH_MAX_HOSTS hosts have been seen
+    """
+    host = urlparse(url).netloc.lower() or "unknown"
+    with _fetch_hosts_lock:
+        if host in _fetch_hosts:
+            return host
+        if len(_fetch_hosts) < FETCH_MAX_HOSTS:
+            _fetch_hosts.add(host)
+            return host
+    return "other"
+
+
+def record_fetch(url, seconds, num_bytes, source_type):
+    """
+    Record a page download: per-host latency, fetch stage time and bytes fetched
+    """
+    FETCH_SECONDS.labels(_host_label(url)).observe(seconds)
+    FETCH_BYTES.labels(source_type).inc(num_bytes)
+    observe_stage("fetch", seconds)
+
+
+def record_chunks(count):
+    CHUNKS.inc(count)
+
+
+def record_tokens(tokens_in, tokens_out):
+    LLM_TOKENS.labels("in").inc(tokens_in or 0)
+    LLM_TOKENS.labels("out").inc(tokens_out or 0)
+
+
+def record_cache(cache, hit):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_coalesced(endpoint):
+    COALESCED_REQUESTS.labels(endpoint).inc()
+
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    Submit work to an executor so that its stage timings count towards the
+    request that submitted it
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _debug_requested():
+    if request.args.get("debug", "").lower() in ("1", "true", "yes"):
+        return True
+    data = request.get_json(silent=True)
+    return isinstance(data, dict) and bool(data.get("debug"))
+
+
+def timed_endpoint(func):
+    """
+    Decorator recording endpoint latency. When the request sets the debug flag
+    (?debug=1 or "debug": true in the body) the JSON response also includes the
+    per-stage breakdown under "stages".
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        breakdown = StageBreakdown() if _debug_requested() else None
+        token = _breakdown.set(breakdown)
+        start = time.perf_counter()
+        try:
+            response = current_app.make_response(func(*args, **kwargs))
+        finally:
+            _breakdown.reset(token)
+        elapsed = time.perf_counter() - start
+        REQUEST_SECONDS.labels(func.__name__, str(response.status_code)).observe(elapsed)
+        logger.debug(f"Function {func.__name__} executed in {elapsed:.2f} seconds")
+
+        if breakdown is not None and response.is_json:
+            data = response.get_json()
+            if isinstance(data, dict):
+                data["stages"] = breakdown.as_dict()
+                data["elapsed_seconds"] = round(elapsed, 4)
+                response.set_data(json.dumps(data))
+        return response
+    return wrapper
+
+
+def metrics_response():
+    """
+    Render all metrics in the Prometheus text format. Under gunicorn the
+    metrics of every worker process are aggregated from PROMETHEUS_MULTIPROC_DIR.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,227 @@
+# Report Store
+# Stores generated reports in SQLite, indexed by time, query and cited URL.
+
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    query TEXT NOT NULL,
+    query_norm TEXT NOT NULL,
+    source_count INTEGER NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reports_created ON reports (created_at);
+CREATE INDEX IF NOT EXISTS idx_reports_query ON reports (query_norm, created_at);
+CREATE TABLE IF NOT EXISTS report_urls (
+    url TEXT NOT NULL,
+    report_id INTEGER NOT NULL REFERENCES reports (id) ON DELETE CASCADE,
+    PRIMARY KEY (url, report_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_report_urls_report ON report_urls (report_id);
+"""
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def parse_time(value):
+    """
+    Parse an epoch timestamp or ISO 8601 date/datetime into epoch seconds
+    """
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(value).timestamp()
+
+
+class ReportStore:
+    def __init__(self, db_path="/app/data/reports.db", max_reports=None, max_age_days=None):
+        """
+        Open (or create) the report database.
+
+        Args:
+            db_path: Location of the SQLite database file
+            max_reports: Keep at most this many reports, 0 for no limit
+            max_age_days: Delete reports older than this many days, 0 to keep forever
+        """
+        self.db_path = db_path
+        self.max_reports = max_reports if max_reports is not None else int(os.environ.get("REPORT_MAX_COUNT", 10000))
+        self.max_age_days = max_age_days if max_age_days is not None else float(os.environ.get("REPORT_MAX_AGE_DAYS", 0))
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        # Do not carry this connection into forked worker processes
+        self.close()
+
+    def _connect(self):
+        """
+        Return this thread's connection, opening a new one after a fork
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    def save(self, query, report, citations, created_at=None):
+        """
+        Store a report with its citations and apply the retention policy
+
+        Returns:
+            ID of the stored report
+        """
+        body = zlib.compress(json.dumps({"report": report, "citations": citations}, ensure_ascii=False).encode("utf-8"))
+        urls = {c.get("url") for c in citations if c.get("url")}
+
+        with metrics.stage("report_save"):
+            conn = self._connect()
+            with conn:
+                cursor = conn.execute(
+                    "INSERT INTO reports (created_at, query, query_norm, source_count, body) VALUES (?, ?, ?, ?, ?)",
+                    (created_at or time.time(), query, normalize_query(query), len(citations), body)
+                )
+                report_id = cursor.lastrowid
+                conn.executemany(
+                    "INSERT OR IGNORE INTO report_urls (url, report_id) VALUES (?, ?)",
+                    [(url, report_id) for url in urls]
+                )
+                self._apply_retention(conn)
+
+        return report_id
+
+    def _apply_retention(self, conn):
+        if self.max_age_days:
+            conn.execute("DELETE FROM reports WHERE created_at < ?", (time.time() - self.max_age_days * 86400,))
+        if self.max_reports:
+            # Keep the newest reports by creation time; imported reports get new IDs
+            # but keep their original timestamps, so IDs are not in time order
+            conn.execute(
+                "DELETE FROM reports WHERE id IN "
+                "(SELECT id FROM reports ORDER BY created_at DESC, id DESC LIMIT -1 OFFSET ?)",
+                (self.max_reports,)
+            )
+
+    def list(self, query=None, url=None, since=None, until=None, limit=20, offset=0):
+        """
+        List report summaries, newest first, without their bodies
+
+        Args:
+            query: Only reports whose normalized query starts with this text
+            url: Only reports citing this exact URL
+            since: Only reports created at or after this time (epoch seconds or ISO 8601)
+            until: Only reports created before this time
+            limit: Maximum number of reports to return
+            offset: Number of reports to skip
+
+        Returns:
+            List of report summaries
+        """
+        sql = "SELECT r.id, r.created_at, r.query, r.source_count FROM reports r"
+        where = []
+        params = []
+        if url:
+            sql += " JOIN report_urls u ON u.report_id = r.id AND u.url = ?"
+            params.append(url)
+        if query:
+            # Range scan on the query index instead of LIKE, which cannot use it
+            prefix = normalize_query(query)
+            where.append("r.query_norm >= ? AND r.query_norm < ?")
+            params.extend([prefix, prefix + "\uffff"])
+        since, until = parse_time(since), parse_time(until)
+        if since is not None:
+            where.append("r.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("r.created_at < ?")
+            params.append(until)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.created_at DESC LIMIT ? OFFSET ?"
+        params.extend([int(limit), int(offset)])
+
+        rows = self._connect().execute(sql, params).fetchall()
+        return [self._summary(row) for row in rows]
+
+    def get(self, report_id):
+        """
+        Return a full report with its citations, or None if it does not exist
+        """
+        row = self._connect().execute(
+            "SELECT id, created_at, query, source_count, body FROM reports WHERE id = ?", (report_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        result = self._summary(row)
+        result.update(json.loads(zlib.decompress(row["body"]).decode("utf-8")))
+        return result
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM reports").fetchone()[0]
+
+    def _summary(self, row):
+        return {
+            "id": row["id"],
+            "created_at": datetime.fromtimestamp(row["created_at"]).isoformat(timespec="seconds"),
+            "query": row["query"],
+            "source_count": row["source_count"]
+        }
+
+    def import_json_directory(self, directory):
+        """
+        Import reports saved as individual JSON files by earlier versions
+
+        Returns:
+            Number of reports imported
+        """
+        imported = 0
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                created_at = datetime.strptime(data["timestamp"], "%Y%m%d_%H%M%S").timestamp()
+                self.save(data["query"], data["report"], data.get("citations", []), created_at)
+                imported += 1
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping {path}: {str(e)}")
+        return imported
+
+
+if __name__ == "__main__":
+    # Usage: python report_store.py <reports directory> [database path]
+    store = ReportStore(sys.argv[2] if len(sys.argv) > 2 else "/app/data/reports.db")
+    print(f"Imported {store.import_json_directory(sys.argv[1])} reports into {store.db_path}")
@@ -1,11 +1,127 @@
 import os
+import re
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qsl, urlencode
 import requests
+from utils import TTLCache
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Words dropped when reducing a question to its keywords
+STOPWORDS = {
+    "a", "an", "the", "what", "which", "who", "whom", "whose", "when", "where", "why", "how",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "can", "could", "should",
+    "would", "will", "of", "in", "on", "for", "to", "from", "by", "with", "about", "into",
+    "and", "or", "vs", "versus", "there", "their", "its", "it", "this", "that", "these", "those",
+    "me", "my", "we", "our", "you", "your", "tell", "explain", "describe"
+}
+
+# Words that introduce a comparison rather than name one of the compared items
+COMPARISON_WORDS = {"compare", "comparing", "comparison", "difference", "differences", "between", "contrast"}
+
+# Query string parameters that only track the visitor and never change the page
+TRACKING_PARAMS = {"fbclid", "gclid", "ref", "ref_src", "mc_cid", "mc_eid"}
+
+
+def expand_query(query, max_queries=3):
+    """
+    Expand a research question into a list of search sub-queries.
+    The original question always comes first, followed by one sub-query per
+    compared item, then keyword variants.
+    """
+    query = " ".join(query.split())
+    candidates = [query]
+
+    words = re.findall(r"[\w\-]+", query.lower())
+    keywords = [w for w in words if w not in STOPWORDS]
+    keyword_query = " ".join(keywords)
+
+    # Questions comparing or listing several things get one sub-query per item
+    parts = re.split(r"\s*(?:,|;|\band\b|\bvs\.?|\bversus\b)\s*", query, flags=re.IGNORECASE)
+    parts = [
+        [w for w in re.findall(r"[\w\-]+", p.lower()) if w not in STOPWORDS and w not in COMPARISON_WORDS]
+        for p in parts
+    ]
+    parts = [p for p in parts if p]
+    if len(parts) > 1:
+        # "Compare Rust vs Go for web servers": items reduced to a single term
+        # share the context that follows the last item
+        tail = parts[-1][1:]
+        for part in parts:
+            if len(part) == 1:
+                part.extend(tail)
+            if len(part) >= 2:
+                candidates.append(" ".join(part))
+
+    if keywords:
+        candidates.append(keyword_query)
+        candidates.append(f"{keyword_query} research")
+        candidates.append(f"{keyword_query} overview")
+
+    sub_queries = []
+    seen = set()
+    for candidate in candidates:
+        key = candidate.lower()
+        if key and key not in seen:
+            seen.add(key)
+            sub_queries.append(candidate)
+        if len(sub_queries) >= max_queries:
+            break
+    return sub_queries
+
+
+def normalize_url(url):
+    """
+    Normalize a URL so that trivially different links to the same page compare equal
+    """
+    parsed = urlparse(url.strip())
+    netloc = parsed.netloc.lower()
+    if netloc.startswith("www."):
+        netloc = netloc[4:]
+    if (parsed.scheme == "http" and netloc.endswith(":80")) or (parsed.scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = parsed.path.rstrip("/") or "/"
+    params = [
+        (k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    ]
+    # Scheme is dropped so http and https variants merge
+    normalized = netloc + path
+    if params:
+        normalized += "?" + urlencode(sorted(params))
+    return normalized
+
+
+def join_list(value):
+    """
+    Join a list parameter such as engines into SearXNG's comma-separated form
+    """
+    if isinstance(value, (list, tuple)):
+        return ",".join(str(v) for v in value)
+    return value
+
 
 class SearxngClient:
-    def __init__(self, base_url=None):
+    def __init__(self, base_url=None, cache_ttl=None, cache_size=None, max_workers=None):
         self.base_url = base_url or os.environ.get("SEARXNG_HOST", "http://searxng:8080")
+        self.cache = TTLCache(
+            maxsize=cache_size or int(os.environ.get("SEARCH_CACHE_SIZE", 256)),
+            ttl=cache_ttl or int(os.environ.get("SEARCH_CACHE_TTL", 900))
+        )
+        self.max_workers = max_workers or int(os.environ.get("SEARCH_MAX_WORKERS", 4))
+        self.session = requests.Session()
 
     def search(self, query, categories=None, engines=None, language=None, time_range=None):
+        # Clients may send categories and engines as JSON lists, which cannot be cache keys
+        categories, engines = join_list(categories), join_list(engines)
+        key = (" ".join(query.lower().split()), categories, engines, language, time_range)
+        cached = self.cache.get(key)
+        metrics.record_cache("search", cached is not None)
+        if cached is not None:
+            return cached
+
         params = {"q": query, "format": "json"}
         if categories:
             params["categories"] = categories
@@ -15,6 +131,64 @@ class SearxngClient:
             params["language"] = language
         if time_range:
             params["time_range"] = time_range
-        resp = requests.get(f"{self.base_url}/search", params=params)
-        resp.raise_for_status()
-        return resp.json()
+        with metrics.stage("search"):
+            resp = self.session.get(f"{self.base_url}/search", params=params, timeout=30)
+            resp.raise_for_status()
+            results = resp.json()
+        self.cache.set(key, results)
+        return results
+
+    def search_many(self, queries, categories=None, engines=None, language=None, time_range=None):
+        """
+        Run several queries concurrently and merge their results.
+
+        Results are de-duplicated by normalized URL, keeping the entry with the
+        highest SearXNG score, and sorted by score with the number of sub-queries
+        that returned the URL as a tie-breaker. Failed sub-queries are logged
+        and skipped unless every sub-query fails.
+
+        Returns:
+            Dictionary with merged results and the sub-queries that were run
+        """
+        def run(q):
+            return self.search(q, categories, engines, language, time_range)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(queries)))) as executor:
+            futures = [(q, metrics.submit(executor, run, q)) for q in queries]
+
+        merged = {}
+        errors = []
+        for rank, (q, future) in enumerate(futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                logger.warning(f"Sub-query '{q}' failed: {str(e)}")
+                errors.append(e)
+                continue
+
+            for result in response.get("results", []):
+                url = result.get("url")
+                if not url:
+                    continue
+                key = normalize_url(url)
+                score = result.get("score", 0) or 0
+                entry = merged.get(key)
+                if entry is None:
+                    merged[key] = {**result, "score": score, "sub_queries": [q], "_order": (rank, len(merged))}
+                else:
+                    if q not in entry["sub_queries"]:
+                        entry["sub_queries"].append(q)
+                    if score > entry["score"]:
+                        merged[key] = {**result, "score": score, "sub_queries": entry["sub_queries"], "_order": entry["_order"]}
+
+        if errors and len(errors) == len(queries):
+            raise errors[0]
+
+        results = sorted(
+            merged.values(),
+            key=lambda r: (-r["score"], -len(r["sub_queries"]), r["_order"])
+        )
+        for result in results:
+            del result["_order"]
+
+        return {"queries": list(queries), "results": results}
@@ -2,92 +2,548 @@
 # Handles indexing, retrieval, and metadata management.
 
 import os
+import re
 import json
+import uuid
+import threading
+import fcntl
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from txtai.embeddings import Embeddings
 import logging
+from utils import ReadWriteLock
+import metrics
 
 logger = logging.getLogger(__name__)
 
-class TxtaiManager:
-    def __init__(self, index_path="/app/txtai_index/research_index"):
+MODEL_PATH = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Collection names become file names, so keep them to a safe character set
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_\-]{0,63}$")
+
+class IndexShard:
+    """
+    One collection's embeddings index, stored at its own path and loaded,
+    saved and reloaded independently of the other collections
+    """
+    def __init__(self, name, index_path, models, load=True):
+        """
+        Create the shard and load its index from disk, unless load is False,
+        e.g. for an ingest that rebuilds the index anyway
+        """
+        self.name = name
         self.index_path = index_path
         self.embeddings = None
-        self._initialize_embeddings()
+        self.models = models  # Vector model cache shared by all shards
+        self.lock = ReadWriteLock()
+        self._refresh_lock = threading.Lock()
+        self._loaded_version = None
+        self.closed = False
+        self._initialize_embeddings(load)
 
-    def _initialize_embeddings(self):
+    def _create_embeddings(self):
         """
-        Initialize txtai embeddings with appropriate settings for hardware constraints
+        Create an empty embeddings instance with appropriate settings for hardware constraints
         """
         # Configure embeddings with all-MiniLM-L6-v2 model (efficient for the hardware)
-        self.embeddings = Embeddings(
+        return Embeddings(
             {
-                "path": "sentence-transformers/all-MiniLM-L6-v2",
+                "path": MODEL_PATH,
                 "content": True,  # Store content in the index
                 "faiss": {
                     "nprobe": 6,  # Number of clusters to search (performance vs accuracy tradeoff)
                     "components": ["Flat"]  # Use flat index for better accuracy on smaller datasets
                 }
-            }
+            },
+            models=self.models
         )
 
+    def _initialize_embeddings(self, load=True):
+        """
+        Initialize txtai embeddings and load the existing index if available
+        """
+        self.embeddings = self._create_embeddings()
+
         # Load existing index if available
-        if os.path.exists(f"{self.index_path}.tar.gz"):
+        if load and self._index_exists():
             try:
-                logger.info(f"Loading existing index from {self.index_path}.tar.gz")
-                self.embeddings.load(self.index_path)
+                logger.info(f"Loading existing index from {self._stored_path()}")
+                with self._file_lock(shared=True):
+                    self._loaded_version = self._disk_version()
+                    self.embeddings.load(self._stored_path())
             except Exception as e:
                 logger.error(f"Error loading index: {str(e)}")
                 # Continue with a fresh index
                 pass
 
-    def index_documents(self, documents):
+    def _stored_path(self):
+        """
+        Return the on-disk location of the index, either a directory or an archive
+        """
+        if os.path.exists(f"{self.index_path}.tar.gz") and not os.path.isdir(self.index_path):
+            return f"{self.index_path}.tar.gz"
+        return self.index_path
+
+    def _index_exists(self):
+        return os.path.exists(self.index_path) or os.path.exists(f"{self.index_path}.tar.gz")
+
+    @contextmanager
+    def _file_lock(self, shared=False):
+        """
+        Cross-process lock on the index files. Worker processes hold it shared
+        while loading and exclusively while saving.
+        """
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        with open(f"{self.index_path}.lock", "a") as handle:
+            fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _disk_version(self):
+        """
+        Return a token identifying the last index save by any process
+        """
+        try:
+            stat = os.stat(f"{self.index_path}.version")
+            return (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _read_url_ids(self):
+        """
+        Return the chunk IDs indexed for each source URL
+        """
+        try:
+            with open(f"{self.index_path}.urls.json", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_url_ids(self, url_ids):
+        urls_file = f"{self.index_path}.urls.json"
+        tmp_file = f"{urls_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(url_ids, f)
+        os.replace(tmp_file, urls_file)
+
+    def _bump_version(self):
+        version_file = f"{self.index_path}.version"
+        tmp_file = f"{version_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_file, version_file)
+
+    def refresh(self):
+        """
+        Reload the index if another worker process has saved a newer version.
+        The new index is loaded off to the side and swapped in under the write
+        lock, so readers keep using the previous index until it is complete.
+        """
+        if self.closed or self._disk_version() == self._loaded_version or not self._index_exists():
+            return
+
+        # Only one thread reloads, the others keep serving the current index
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        try:
+            previous = self._loaded_version
+            with self._file_lock(shared=True):
+                version = self._disk_version()
+                embeddings = self._create_embeddings()
+                embeddings.load(self._stored_path())
+
+            with self.lock.write():
+                # Skip the swap if a local ingest saved a newer index meanwhile
+                if self._loaded_version == previous and not self.closed:
+                    embeddings, self.embeddings = self.embeddings, embeddings
+                    self._loaded_version = version
+                    logger.info(f"Reloaded index from {self._stored_path()}")
+
+            # Either the replaced index or the unused reload
+            self._close(embeddings)
+        except Exception as e:
+            logger.error(f"Error reloading index: {str(e)}")
+        finally:
+            self._refresh_lock.release()
+
+    def index(self, data, url_ids=None):
+        """
+        Add (id, text, metadata) tuples to the index and save it.
+        The update is built and saved on a separate instance while readers keep
+        searching the current index; the write lock is only taken for the swap.
+
+        Args:
+            data: List of (id, text, metadata) tuples
+            url_ids: Mapping of each source URL in data to its chunk IDs. Chunks
+                previously indexed for these URLs that are not in the batch are deleted.
+
+        Returns:
+            True if the update was saved
+        """
+        # Hold the cross-process lock for the whole update so a save from another
+        # worker or thread cannot interleave
+        with self._file_lock():
+            # Every write is saved, so the files on disk hold the latest index,
+            # including changes saved by other workers
+            embeddings = self._create_embeddings()
+            if self._index_exists():
+                embeddings.load(self._stored_path())
+
+            # Drop chunks of re-processed pages that are no longer produced,
+            # e.g. when a page now splits into fewer chunks
+            indexed_ids = self._read_url_ids()
+            stale = []
+            for url, ids in (url_ids or {}).items():
+                stale.extend(set(indexed_ids.get(url, [])) - set(ids))
+                indexed_ids[url] = list(ids)
+            if stale:
+                embeddings.delete(stale)
+
+            # Upsert so documents accumulate and re-ingested chunks replace their old version
+            with metrics.stage("embed"):
+                embeddings.upsert(data)
+
+            # Save the index to disk
+            if not self._save_index(embeddings, indexed_ids):
+                self._close(embeddings)
+                return False
+
+            with self.lock.write():
+                # An evicted shard keeps nothing in memory, the update is on disk
+                if not self.closed:
+                    embeddings, self.embeddings = self.embeddings, embeddings
+                    self._loaded_version = self._disk_version()
+
+        self._close(embeddings)
+        return True
+
+    def search(self, query, limit):
+        """
+        Search this shard, returning raw txtai results, or None if the shard has been closed
+        """
+        # Every write is saved, so a shard with nothing on disk is empty
+        if not self._index_exists():
+            return []
+
+        self.refresh()
+        with self.lock.read(), metrics.stage("retrieve"):
+            if self.embeddings is None:
+                return None
+            return self.embeddings.search(query, limit)
+
+    def count(self):
+        """
+        Return the number of indexed chunks, or None if the shard has been closed
+        """
+        self.refresh()
+        with self.lock.read():
+            return self.embeddings.count() if self.embeddings else None
+
+    def close(self):
+        """
+        Release the index. Waits for searches in progress; later calls report the shard as closed.
+        """
+        with self.lock.write():
+            embeddings, self.embeddings = self.embeddings, None
+            self.closed = True
+        self._close(embeddings)
+
+    def _save_index(self, embeddings, url_ids):
+        """
+        Save an index and its URL to chunk ID mapping to disk. Callers hold the exclusive file lock.
+
+        Returns:
+            True if the index was saved
+        """
+        try:
+            # Ensure directory exists
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+
+            # Save the index
+            with metrics.stage("index_save"):
+                embeddings.save(self.index_path)
+            self._write_url_ids(url_ids)
+            self._bump_version()
+            logger.info(f"Index saved to {self.index_path}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving index: {str(e)}")
+            return False
+
+    def _close(self, embeddings):
+        """
+        Release an index instance that is no longer searched
+        """
+        try:
+            if embeddings is not None:
+                embeddings.close()
+        except Exception as e:
+            logger.warning(f"Error closing index {self.name}: {str(e)}")
+
+class TxtaiManager:
+    def __init__(self, index_root="/app/txtai_index", default_collection="research_index", max_loaded=None):
+        """
+        Manage named collections, each stored as its own index shard under index_root.
+        At most max_loaded shards are kept in memory; the least recently used
+        shard is evicted when another one is loaded.
+        """
+        self.index_root = index_root
+        self.default_collection = default_collection
+        self.max_loaded = max_loaded or int(os.environ.get("INDEX_MAX_LOADED_SHARDS", 8))
+        self.max_workers = int(os.environ.get("INDEX_SEARCH_WORKERS", 4))
+        # Collections not in memory that a "*" query searches, most recently written first
+        self.max_cold_search = int(os.environ.get("INDEX_MAX_COLD_SEARCH", 8))
+        # Process-wide limit on collections loaded at once for such searches
+        self._cold_loads = threading.BoundedSemaphore(int(os.environ.get("INDEX_MAX_COLD_LOADS", 2)))
+        self.models = {}  # Shared vector model cache, so shards load the model only once
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+
+        # Model-only instance used to score text without an index, sharing the model cache
+        self.scorer = Embeddings({"path": MODEL_PATH}, models=self.models)
+
+        # Load the default collection up front so the model is in memory before workers fork
+        self._shard(self.default_collection)
+
+    def _validate(self, collection):
+        collection = collection or self.default_collection
+        if not isinstance(collection, str) or not COLLECTION_NAME.match(collection):
+            raise ValueError(f"Invalid collection name: {collection}")
+        return collection
+
+    def _exists(self, collection):
+        """
+        Return whether a collection has been saved to disk
+        """
+        path = os.path.join(self.index_root, collection)
+        return os.path.exists(path) or os.path.exists(f"{path}.tar.gz")
+
+    def _shard(self, collection, create=True):
+        """
+        Return the shard for a collection, loading it and evicting the least
+        recently used shard if needed. With create=False, returns None for a
+        collection that is neither loaded nor on disk instead of adding an empty shard.
+        """
+        with self._lock:
+            shard = self._shards.get(collection)
+            if shard is not None:
+                self._shards.move_to_end(collection)
+                return shard
+            if not create and not self._exists(collection):
+                return None
+            loading = self._loading.get(collection)
+            if loading is None:
+                loading = self._loading[collection] = threading.Lock()
+
+        # Load outside the manager lock so other collections stay available
+        with loading:
+            with self._lock:
+                shard = self._shards.get(collection)
+            if shard is None:
+                shard = self._add(IndexShard(collection, os.path.join(self.index_root, collection), self.models))
+            with self._lock:
+                if self._loading.get(collection) is loading:
+                    del self._loading[collection]
+
+        return shard
+
+    def _add(self, shard):
+        """
+        Put a loaded shard in the LRU and evict the least recently used shards.
+        If another thread added the same collection meanwhile, that shard is
+        kept and returned and this one is closed.
+        """
+        with self._lock:
+            current = self._shards.setdefault(shard.name, shard)
+            self._shards.move_to_end(shard.name)
+            evicted = []
+            while len(self._shards) > self.max_loaded:
+                evicted.append(self._shards.popitem(last=False)[1])
+        if current is not shard:
+            evicted.append(shard)
+
+        # Shards are saved on every write, so evicting only frees the memory.
+        # Closing waits for searches in progress on the shard.
+        for old in evicted:
+            old.close()
+            logger.info(f"Evicted index shard {old.name}")
+
+        return current
+
+    def _loaded(self, collection, fn):
+        """
+        Call fn with the collection's shard, loading it again if the shard was
+        evicted and closed before fn ran. Returns None if the collection does
+        not exist, or if the shard was closed twice.
+        """
+        for _ in range(2):
+            shard = self._shard(collection, create=False)
+            if shard is None:
+                return None
+            result = fn(shard)
+            if result is not None:
+                return result
+        return None
+
+    def list_collections(self):
+        """
+        Return the names of all collections stored on disk or loaded in memory
+        """
+        with self._lock:
+            names = set(self._shards)
+        if os.path.isdir(self.index_root):
+            for entry in os.listdir(self.index_root):
+                path = os.path.join(self.index_root, entry)
+                if entry.endswith(".tar.gz"):
+                    entry = entry[:-len(".tar.gz")]
+                elif not os.path.isdir(path):
+                    continue
+                # Skip files that were not written by this manager
+                if COLLECTION_NAME.match(entry):
+                    names.add(entry)
+        return sorted(names)
+
+    def loaded_collections(self):
+        """
+        Return the collections currently in memory, least recently used first
+        """
+        with self._lock:
+            return list(self._shards)
+
+    def index_documents(self, documents, collection=None):
         """
         Index cleaned and chunked documents
 
         Args:
             documents: List of document dictionaries with text and metadata
+            collection: Collection to index into, defaults to the default collection
 
         Returns:
             Number of documents indexed
         """
+        collection = self._validate(collection)
         if not documents:
             return 0
 
         # Prepare data for indexing
         data = []
-        for idx, doc in enumerate(documents):
+        url_ids = {}
+        for doc in documents:
             text = doc.get("text", "")
             metadata = doc.get("metadata", {})
 
-            # Store full document content and metadata
-            data.append((idx, text, metadata))
+            # Chunks of the same URL keep stable IDs so re-processing a page replaces it
+            if metadata.get("url"):
+                doc_id = f"{metadata['url']}#{metadata.get('chunk_id', 0)}"
+                url_ids.setdefault(metadata["url"], []).append(doc_id)
+            else:
+                doc_id = uuid.uuid4().hex
 
-        # Index the documents
-        self.embeddings.index(data)
+            # Store full document content and metadata
+            data.append((doc_id, text, metadata))
 
-        # Save the index to disk
-        self._save_index()
+        with self._lock:
+            shard = self._shards.get(collection)
+        if shard is not None:
+            shard.index(data, url_ids)
+        else:
+            # The ingest loads the index itself to build the update, so do not load it twice
+            shard = IndexShard(collection, os.path.join(self.index_root, collection), self.models, load=False)
+            try:
+                saved = shard.index(data, url_ids)
+            except Exception:
+                shard.close()
+                raise
+            if saved:
+                self._add(shard)
+            else:
+                shard.close()
 
         return len(documents)
 
-    def retrieve(self, query, limit=10):
+    def retrieve(self, query, limit=10, collections=None, skipped=None):
         """
         Retrieve relevant content for a query
 
         Args:
             query: Search query
             limit: Maximum number of results to return
+            collections: Collection name, list of names, or "*" for all
+                collections. Defaults to the default collection.
+            skipped: Optional list that receives the collections a "*" query
+                left out because of the INDEX_MAX_COLD_SEARCH cap
 
         Returns:
-            List of retrieved documents with text and metadata
+            List of retrieved documents with text, metadata, score and collection
         """
-        if not self.embeddings:
-            logger.error("Embeddings not initialized")
+        cold = []
+        if collections == "*":
+            collections, cold, left_out = self._wildcard_collections()
+            if skipped is not None:
+                skipped.extend(left_out)
+        elif not isinstance(collections, list):
+            collections = [collections]
+        collections = list(dict.fromkeys(self._validate(c) for c in collections))
+
+        searches = [(c, False) for c in collections] + [(c, True) for c in cold]
+        if not searches:
             return []
+        if len(searches) == 1:
+            results = self._retrieve_shard(searches[0][0], query, limit, searches[0][1])
+        else:
+            # Fan out to the shards in parallel and merge by score
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(searches))) as executor:
+                futures = [
+                    metrics.submit(executor, self._retrieve_shard, c, query, limit, transient)
+                    for c, transient in searches
+                ]
+                results = [doc for future in futures for doc in future.result()]
+            results.sort(key=lambda doc: doc["score"] or 0, reverse=True)
+
+        return results[:limit]
+
+    def _wildcard_collections(self):
+        """
+        Split all collections into the loaded ones and the cold ones a "*" query
+        searches without loading them into the LRU. At most max_cold_search cold
+        collections are searched, preferring the most recently written.
+        """
+        loaded = set(self.loaded_collections())
+        names = self.list_collections()
+        cold = [name for name in names if name not in loaded]
+
+        def written(name):
+            try:
+                return os.stat(os.path.join(self.index_root, f"{name}.version")).st_mtime_ns
+            except FileNotFoundError:
+                return 0
 
+        cold.sort(key=written, reverse=True)
+        skipped = sorted(cold[self.max_cold_search:])
+        if skipped:
+            logger.warning(f"Searching {self.max_cold_search} of {len(cold)} collections not in memory")
+
+        return [name for name in names if name in loaded], cold[:self.max_cold_search], skipped
+
+    def _retrieve_shard(self, collection, query, limit, transient=False):
         try:
             # Retrieve results
-            results = self.embeddings.search(query, limit)
+            if transient:
+                # Load the shard for this search only so the loaded set is not evicted.
+                # The semaphore bounds how many such shards are in memory across requests.
+                with self._cold_loads:
+                    shard = IndexShard(collection, os.path.join(self.index_root, collection), self.models)
+                    try:
+                        results = shard.search(query, limit) or []
+                    finally:
+                        shard.close()
+            else:
+                results = self._loaded(collection, lambda shard: shard.search(query, limit)) or []
 
             retrieved_docs = []
             for result in results:
@@ -109,41 +565,53 @@ class TxtaiManager:
                 retrieved_docs.append({
                     "text": text,
                     "metadata": metadata,
-                    "score": score
+                    "score": score,
+                    "collection": collection
                 })
 
             return retrieved_docs
         except Exception as e:
-            logger.error(f"Error retrieving results: {str(e)}")
+            logger.error(f"Error retrieving results from {collection}: {str(e)}")
             return []
 
-    def _save_index(self):
+    def score(self, query, texts):
         """
-        Save the index to disk
+        Score texts against a query with the embedding model, without indexing them
+
+        Args:
+            query: Search query
+            texts: List of texts to score
+
+        Returns:
+            List of similarity scores in the order of texts
         """
-        try:
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        if not texts:
+            return []
 
-            # Save the index
-            self.embeddings.save(self.index_path)
-            logger.info(f"Index saved to {self.index_path}")
-        except Exception as e:
-            logger.error(f"Error saving index: {str(e)}")
+        with metrics.stage("relevance"):
+            results = self.scorer.similarity(query, texts)
+
+        scores = [0.0] * len(texts)
+        for idx, score in results:
+            scores[idx] = float(score)
+        return scores
 
-    def get_index_info(self):
+    def get_index_info(self, collection=None):
         """
-        Return information about the current index
+        Return information about a collection's index
         """
         try:
-            index_exists = os.path.exists(f"{self.index_path}.tar.gz")
-            document_count = len(self.embeddings.search("", 1)) if self.embeddings else 0
+            collection = self._validate(collection)
 
+            # Reading the info of a missing collection must not create it
             return {
-                "index_exists": index_exists,
-                "document_count": document_count,
-                "index_path": self.index_path,
-                "model": "sentence-transformers/all-MiniLM-L6-v2"
+                "collection": collection,
+                "index_exists": self._exists(collection),
+                "document_count": self._loaded(collection, lambda shard: shard.count()) or 0,
+                "index_path": os.path.join(self.index_root, collection),
+                "model": MODEL_PATH,
+                "loaded_collections": self.loaded_collections(),
+                "max_loaded_collections": self.max_loaded
             }
         except Exception as e:
             logger.error(f"Error getting index info: {str(e)}")
@@ -3,8 +3,10 @@
 import logging
 import json
 import os
+import threading
 import time
-from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
 
 # Set up logging
 def setup_logging(log_level=logging.INFO):
@@ -26,35 +28,6 @@ def ensure_directories(directories):
     for directory in directories:
         os.makedirs(directory, exist_ok=True)
 
-# Function to save research results
-def save_research_results(query, report, citations, output_dir="/app/data/reports"):
-    """
-    Save research results to JSON file
-    """
-    # Ensure output directory exists
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Create a timestamp for the filename
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-
-    # Create a safe filename from query
-    safe_query = "".join(c if c.isalnum() else "_" for c in query)[:50]
-    filename = f"{output_dir}/{timestamp}_{safe_query}.json"
-
-    # Prepare the data
-    data = {
-        "query": query,
-        "timestamp": timestamp,
-        "report": report,
-        "citations": citations
-    }
-
-    # Save to file
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-    return filename
-
 # Function to format citations
 def format_citations(citations):
     """
@@ -78,16 +51,202 @@ def format_citations(citations):
 
     return formatted_citations
 
-# Performance monitoring
-def timing_decorator(func):
+# Thread-safe TTL cache
+class TTLCache:
+    """
+    Bounded in-memory cache whose entries expire after a fixed time-to-live.
+    Least recently used entries are evicted once maxsize is reached.
+    """
+    def __init__(self, maxsize=256, ttl=900):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default if missing or expired
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        Store value under key, evicting the oldest entries if the cache is full
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all entries and reset the hit/miss counters
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return cache size and hit rate information
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+# Reader/writer lock
+class ReadWriteLock:
+    """
+    Lock allowing many concurrent readers or a single writer.
+    Waiting writers block new readers so ingest is not starved by retrieval.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+# Client-side rate limiter
+class RateLimiter:
     """
-    Decorator to measure and log function execution time
+    Token bucket allowing `rate` calls per `period` seconds on average, with
+    bursts of up to `burst` calls. The limit applies to this process only.
+    """
+    def __init__(self, rate, period=60.0, burst=1):
+        self.rate = rate / period
+        self.capacity = max(1.0, float(burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a token is available and take it
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now, going into debt if needed, so waiting callers queue in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+# Request coalescing
+def request_key(endpoint, params):
+    """
+    Build a key identifying a request by its normalized parameters.
+    The query is compared case- and whitespace-insensitively and the debug flag is ignored.
+    """
+    normalized = {k: v for k, v in params.items() if k != "debug"}
+    if isinstance(normalized.get("query"), str):
+        normalized["query"] = " ".join(normalized["query"].lower().split())
+    return f"{endpoint}:{json.dumps(normalized, sort_keys=True, default=str)}"
+
+class SingleFlight:
     """
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        execution_time = end_time - start_time
-        logging.info(f"Function {func.__name__} executed in {execution_time:.2f} seconds")
-        return result
-    return wrapper
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller (the leader) runs the function; callers arriving while it
+    is in flight wait and receive the same result. If the leader raises or its
+    result is a failure according to `failed`, the key is cleared and the
+    waiting callers do not get that outcome: one of them becomes the new
+    leader and runs the function again, and the rest wait for it. A caller
+    that waits longer than wait_timeout runs the function itself.
+    """
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.failed = False
+
+    def __init__(self, wait_timeout=None, failed=None):
+        self.wait_timeout = wait_timeout
+        self.failed = failed or (lambda result: False)
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn or join an identical call in flight.
+
+        Returns:
+            Tuple of the result and whether it was shared from another caller
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = self._Call()
+
+            if leader:
+                break
+
+            if not call.done.wait(self.wait_timeout):
+                logging.warning(f"Timed out waiting for in-flight request {key[:100]}, running it separately")
+                return fn(*args, **kwargs), False
+            if not call.failed:
+                return call.result, True
+            # The leader failed, elect a new one among the waiting callers
+
+        try:
+            call.result = fn(*args, **kwargs)
+            call.failed = self.failed(call.result)
+            return call.result, False
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()